@@ -1,5 +1,39 @@
+import logging
+import queue
+import re
 import sqlite3
+import threading
 import uuid
+from contextlib import contextmanager
+from functools import cached_property
+from itertools import chain, groupby, islice
+from operator import itemgetter
+
+logger = logging.getLogger(__name__)
+
+# 旧版本 SQLite 单条语句允许绑定的最大参数个数（SQLITE_MAX_VARIABLE_NUMBER）
+SQLITE_MAX_VARIABLES = 999
+
+# 合法的表名：字母或下划线开头，只包含字母、数字和下划线
+TABLE_NAME_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+# 会改变表结构的语句，执行后需要重新读取 table_info
+SCHEMA_CHANGE_PATTERN = re.compile(r"^\s*(CREATE|ALTER|DROP)\b", re.IGNORECASE)
+
+# 自动调整 buffer_limit 时按列类型估算的每列字节数，未知类型使用 DEFAULT_COLUMN_BYTES
+COLUMN_TYPE_BYTES = {"INT": 8, "REAL": 8, "FLOA": 8, "DOUB": 8, "CHAR": 32, "TEXT": 32, "CLOB": 32, "BLOB": 64}
+DEFAULT_COLUMN_BYTES = 16
+# 缓冲区中每行 (列名元组, 值元组) 以及每个值对象在 Python 中的额外开销
+PYTHON_ROW_OVERHEAD = 112
+PYTHON_COLUMN_OVERHEAD = 48
+MIN_BUFFER_LIMIT = 1000
+MAX_BUFFER_LIMIT = 100000
+
+# 默认的内存映射大小（256 MiB），读取时直接访问映射的文件页，减少内核到用户态的拷贝
+DEFAULT_MMAP_SIZE = 268435456
+
+# 通知后台写入线程退出的哨兵
+_STOP = object()
 
 class SQLiteOperator:
     """
@@ -15,61 +49,170 @@ class SQLiteOperator:
         buffer_limit (int): 插入缓冲区的最大记录数。
     """
 
-    def __init__(self, database_name, table_name) -> None:
+    def __init__(self, database_name, table_name, buffer_limit: int = None, background_writer: bool = False,
+                 mmap_size: int = DEFAULT_MMAP_SIZE) -> None:
         """
         初始化 SQLiteOperator。
 
         参数:
             database_name (str): SQLite 数据库的名称。
             table_name (str): 数据库中的表名称。
+            buffer_limit (int): 插入缓冲区的最大记录数。为 None 时在第一次插入前根据页缓存大小和行宽
+                自动计算，表结构变化后重新计算。
+            background_writer (bool): 是否由后台线程异步写入 buffer_insert() 提交的数据。后台线程使用
+                自己的连接按批提交，这些写入不属于 with SQLiteOperator(...) 的事务，异常时不会回滚。
+            mmap_size (int): PRAGMA mmap_size 的字节数，为 0 时不使用内存映射。
+
+        异常:
+            ValueError: 如果表名不是合法的标识符，或对内存数据库启用后台写入。
         """
+        if not isinstance(table_name, str) or not TABLE_NAME_PATTERN.fullmatch(table_name):
+            raise ValueError(f"在初始化 SQLiteOperator 时，'table_name' 不是合法的表名: {table_name!r}。")
+        if background_writer and database_name == ":memory:":
+            raise ValueError("内存数据库无法在多个连接之间共享，不能启用 'background_writer'。")
         self.database_name = database_name
         self.table_name = table_name
+        self.mmap_size = int(mmap_size)
+        # 表名只校验和引用一次，常用语句预先拼好，每次调用使用相同的 SQL 文本
+        self._qtable = '"' + table_name.replace('"', '""') + '"'
+        self._sql_pragma_info = f"SELECT * FROM pragma_table_info('{table_name}');"
+        self._sql_delete_all = f"DELETE FROM {self._qtable}"
         self.connection = None
         self.cursor = None
-        self.table_info = None
         self.insert_buffer = []
-        self.buffer_limit = 100
+        self._auto_buffer_limit = buffer_limit is None
+        self._buffer_limit_tuned = False
+        self.buffer_limit = MIN_BUFFER_LIMIT if buffer_limit is None else buffer_limit
+        self._insert_sql_cache = {}
+        self._background_writer = background_writer
+        self._queue = None
+        self._writer = None
+        self._writer_error = None
+        self._writer_failed = False
 
     def __enter__(self) -> 'SQLiteOperator':
         """
-        上下文管理器的入口点。连接到数据库并创建游标。
+        上下文管理器的入口点。连接到数据库、创建游标并开始事务，整个 with 代码块在
+        同一个事务中执行。
+
+        启用 background_writer 时不开始事务：主连接持有的写锁会阻塞后台线程的 BEGIN IMMEDIATE，
+        而且后台写入本身也不属于这个事务。此时 with 代码块中的语句按自动提交模式执行。
         """
         self.connect()
+        if not self._background_writer and not self.connection.in_transaction:
+            self.cursor.execute("BEGIN")
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb) -> None:
         """
-        上下文管理器的出口点。提交或回滚事务并断开与数据库的连接。
+        上下文管理器的出口点。等待后台写入线程写完剩余数据，由 sqlite3.Connection 的
+        上下文管理器提交或回滚事务，然后断开与数据库的连接。
 
         参数:
             exc_type: 异常的类型。
             exc_val: 异常的值。
             exc_tb: 异常的回溯信息。
         """
-        if exc_type is None:
-            self.connection.commit()
-        else:
-            self.connection.rollback()
-        self.disconnect()
+        try:
+            self._stop_writer()
+            self.connection.__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.disconnect()
 
     def connect(self) -> None:
         """
-        连接到数据库并创建游标。
+        连接到数据库并创建游标。已连接时直接返回，连接会一直保持到 disconnect() 被调用，
+        以便在多次操作之间复用同一个连接的页缓存。
+
+        连接使用 isolation_level=None，sqlite3 模块不再隐式 BEGIN/COMMIT，事务由本类显式控制。
+
+        每个连接建立后只设置一次 PRAGMA：启用 WAL 日志模式并将同步级别降为 NORMAL，
+        以减少每次提交的 fsync；按 mmap_size 映射数据库文件，读取时直接访问 OS 页缓存；
+        临时表放在内存中并增大页缓存。内存数据库不支持 WAL 和 mmap，因此跳过这两项。
         """
-        self.connection = sqlite3.connect(self.database_name)
+        if self.connection is not None:
+            return
+        self.connection = self._open_connection()
         self.cursor = self.connection.cursor()
 
+    def _open_connection(self) -> sqlite3.Connection:
+        """
+        打开一个新的数据库连接并设置 PRAGMA。
+
+        返回值:
+            sqlite3.Connection: 已设置好 PRAGMA 的数据库连接。
+        """
+        connection = sqlite3.connect(self.database_name, isolation_level=None, cached_statements=256)
+        if self.database_name != ":memory:":
+            connection.executescript(
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                f"PRAGMA mmap_size={self.mmap_size};"
+            )
+        connection.executescript(
+            "PRAGMA temp_store=MEMORY;"
+            "PRAGMA cache_size=-64000;"
+        )
+        return connection
+
+    def _tune_buffer_limit(self) -> None:
+        """
+        根据页缓存大小和估算的行宽设置 buffer_limit，使一次写入的数据约占页缓存的一半，
+        既能摊薄每次提交的开销，又不会让事务中的脏页溢出页缓存。结果限制在
+        MIN_BUFFER_LIMIT~MAX_BUFFER_LIMIT 之间，避免缓冲区占用过多内存。
+
+        只在未指定 buffer_limit 时生效，每次表结构变化后的第一次插入前重新计算一次。
+        表还不存在时保持当前值，等表创建后再计算。
+        """
+        if not self._auto_buffer_limit or self._buffer_limit_tuned:
+            return
+        self.connect()
+        if not self.table_info:
+            return
+        page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+        cache_size = self.connection.execute("PRAGMA cache_size").fetchone()[0]
+        # cache_size 为负数时表示 KiB，为正数时表示页数
+        page_cache_bytes = -cache_size * 1024 if cache_size < 0 else cache_size * page_size
+        row_bytes = self._estimate_row_bytes()
+        self.buffer_limit = min(MAX_BUFFER_LIMIT, max(MIN_BUFFER_LIMIT, page_cache_bytes // row_bytes // 2))
+        self._buffer_limit_tuned = True
+
+    def _estimate_row_bytes(self) -> int:
+        """
+        按列的声明类型估算一行数据的字节数，包括缓冲区中 Python 对象的开销。
+
+        返回值:
+            int: 估算的行字节数。
+        """
+        row_bytes = PYTHON_ROW_OVERHEAD
+        for column_type in map(itemgetter(2), self.table_info):
+            column_type = column_type.upper()
+            row_bytes += PYTHON_COLUMN_OVERHEAD + next(
+                (size for key, size in COLUMN_TYPE_BYTES.items() if key in column_type),
+                DEFAULT_COLUMN_BYTES,
+            )
+        return row_bytes
+
     def disconnect(self) -> None:
         """
-        断开与数据库的连接。
+        断开与数据库的连接。关闭前停止后台写入线程，并执行 PRAGMA optimize，让 SQLite
+        按需更新查询规划器的统计信息。后台写入出错时，关闭连接后再抛出该异常。
         """
-        if self.connection:
-            self.connection.close()
+        try:
+            self._stop_writer()
+        finally:
+            if self.connection:
+                try:
+                    self.connection.execute("PRAGMA optimize")
+                except sqlite3.Error:
+                    pass
+                self.connection.close()
+            self.connection = None
+            self.cursor = None
 
     def execute_with_handling(self, query, params=None) -> None:
         """
-        执行带有错误处理的查询。
+        执行带有错误处理的查询。出错时记录日志并重新抛出异常。
 
         参数:
             query (str): 要执行的 SQL 查询。
@@ -78,22 +221,79 @@ class SQLiteOperator:
         异常:
             sqlite3.Error: 如果执行查询时出错。
         """
+        self.connect()
         try:
             if params:
                 self.cursor.execute(query, params)
             else:
                 self.cursor.execute(query)
-        except sqlite3.Error as e:
-            print(f"数据库错误: {e}")
+        except sqlite3.Error:
+            logger.exception("SQLite error executing %s", query)
+            raise
+        if SCHEMA_CHANGE_PATTERN.match(query):
+            self.refresh_table_info()
+
+    def iter_rows(self, query, params=(), chunk: int = 1024):
+        """
+        分块获取查询结果并逐行返回，避免一次性把整个结果集读入内存。
+
+        参数:
+            query (str): 要执行的 SQL 查询。
+            params (tuple): 查询中要使用的参数。
+            chunk (int): 每次 fetchmany 获取的行数。
+
+        返回值:
+            generator: 逐行产生查询结果的生成器。
+        """
+        self.connect()
+        # 使用独立的游标，迭代过程中仍可通过 self.cursor 执行其他语句
+        cursor = self.connection.cursor()
+        cursor.arraysize = chunk
+        try:
+            cursor.execute(query, params)
+            for rows in iter(cursor.fetchmany, []):
+                yield from rows
+        finally:
+            cursor.close()
 
-    def clear_database_table(self):
+    def clear_database_table(self, vacuum: bool = False) -> None:
         """
         清除表中的数据内容。
+
+        参数:
+            vacuum (bool): 是否在删除后执行 VACUUM 回收磁盘空间。VACUUM 会重写整个数据库文件，
+                默认不执行。
+
+        异常:
+            RuntimeError: 如果在未提交的事务中（例如 with SQLiteOperator(...) 中）要求执行 VACUUM。
         """
-        sql_script = f"DELETE FROM {self.table_name}; VACUUM;"
-        self.connection = sqlite3.connect(self.database_name)
-        self.connection.executescript(sql_script)
-        self.disconnect()
+        self.connect()
+        # VACUUM 不能在事务中执行，不能为了执行 VACUUM 而提前提交调用方的事务
+        if vacuum and self.connection.in_transaction:
+            raise RuntimeError("在调用 SQLiteOperator.clear_database_table() 时，事务未提交，无法执行 VACUUM。")
+        self.cursor.execute(self._sql_delete_all)
+        if vacuum:
+            # 连接处于自动提交模式，DELETE 已经提交
+            self.cursor.execute("VACUUM")
+
+    @cached_property
+    def table_info(self) -> list:
+        """
+        表的所有列信息。每个实例只查询一次，表结构变化后调用 refresh_table_info() 重新读取。
+
+        返回值:
+            list: 包含列信息的列表，每个元素是一个包含列属性的元组。
+        """
+        self.connect()
+        self.cursor.execute(self._sql_pragma_info)
+        return self.cursor.fetchall()
+
+    def refresh_table_info(self) -> None:
+        """
+        丢弃缓存的表信息，下次访问 table_info 时重新查询，并在下次插入前重新计算 buffer_limit。
+        """
+        self.__dict__.pop("table_info", None)
+        self._buffer_limit_tuned = False
 
     def get_table_info(self) -> list:
         """
@@ -102,11 +302,6 @@ class SQLiteOperator:
         返回值:
             list: 包含列信息的列表，每个元素是一个包含列属性的元组。
         """
-        if not self.table_info:
-            self.connect()
-            self.execute_with_handling(f"SELECT * FROM pragma_table_info('{self.table_name}');")
-            self.table_info = self.cursor.fetchall()               
-            self.disconnect()
         return self.table_info
 
     def get_table_column_info(self, info_index: int = None) -> dict:
@@ -123,5 +318,272 @@ class SQLiteOperator:
             raise TypeError("在调用 SQLiteOperator.get_table_column_info() 时缺少必需的位置参数 'info_index'。")
         if info_index > 5:
             raise IndexError("在调用 SQLiteOperator.get_table_column_info() 时，'info_index' 应在 0~5 的范围内。")
-        table_column_info = {column[1]: column[info_index] for column in self.get_table_info()}
-        return table_column_info
+        names = map(itemgetter(1), self.table_info)
+        values = map(itemgetter(info_index), self.table_info)
+        return dict(zip(names, values))
+
+    def _get_insert_query(self, column_names: tuple) -> str:
+        """
+        获取指定列名的 INSERT 语句。相同列名复用同一段 SQL 文本，以命中 SQLite 的语句缓存。
+
+        参数:
+            column_names (tuple): 要插入的列名。
+
+        返回值:
+            str: 带占位符的 INSERT 语句。
+        """
+        column_names = tuple(column_names)
+        query = self._insert_sql_cache.get(column_names)
+        if query is None:
+            placeholders = ', '.join('?' * len(column_names))
+            query = f"INSERT INTO {self._qtable} ({', '.join(column_names)}) VALUES ({placeholders})"
+            self._insert_sql_cache[column_names] = query
+        return query
+
+    def buffer_insert(self, column_names: tuple, column_values: tuple) -> None:
+        """
+        将插入操作添加到缓冲区，缓冲区达到 buffer_limit 时自动写入数据库。
+
+        启用 background_writer 时，数据直接放入队列，由后台线程批量写入；队列已满时才会阻塞。
+        后台写入各自提交，不受 with SQLiteOperator(...) 中异常的回滚影响。
+
+        参数:
+            column_names (tuple): 要插入的列名。
+            column_values (tuple): 与列名对应的值。
+        """
+        row = (tuple(column_names), tuple(column_values))
+        self._tune_buffer_limit()
+        if self._background_writer:
+            self._start_writer()
+            self._raise_writer_error()
+            self._queue.put(row)
+            return
+        self.insert_buffer.append(row)
+        if len(self.insert_buffer) >= self.buffer_limit:
+            self.execute_buffered_inserts()
+
+    def execute_buffered_inserts(self) -> None:
+        """
+        执行缓冲区中的所有插入操作并提交。
+
+        启用 background_writer 时，等待后台线程写完队列中已有的数据。
+
+        异常:
+            sqlite3.Error: 如果写入数据时出错。
+        """
+        if self._writer is not None:
+            self._queue.join()
+            self._raise_writer_error()
+            return
+        if not self.insert_buffer:
+            return
+        self.connect()
+        self._write_rows(self.connection, self.insert_buffer)
+        self.insert_buffer = []
+
+    @staticmethod
+    @contextmanager
+    def _transaction(connection: sqlite3.Connection, mode: str = "DEFERRED"):
+        """
+        显式开始并提交一个事务，出错时回滚。连接已处于事务中（例如在 with SQLiteOperator(...) 中）时
+        改用保存点加入该事务：出错时只回滚代码块内的操作，成功时由外层负责提交或回滚。
+
+        参数:
+            connection (sqlite3.Connection): 数据库连接。
+            mode (str): BEGIN 的事务类型：DEFERRED、IMMEDIATE 或 EXCLUSIVE。
+        """
+        if connection.in_transaction:
+            connection.execute("SAVEPOINT sqlite_operator")
+            try:
+                yield
+            except BaseException:
+                # 某些错误会让 SQLite 自动回滚整个事务，此时保存点已不存在
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK TO sqlite_operator")
+                    connection.execute("RELEASE sqlite_operator")
+                raise
+            connection.execute("RELEASE sqlite_operator")
+            return
+        connection.execute(f"BEGIN {mode}")
+        try:
+            yield
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+
+    def _write_rows(self, connection: sqlite3.Connection, rows: list) -> None:
+        """
+        原子地写入多行数据：没有打开的事务时在一个 BEGIN IMMEDIATE 事务中写入并提交；已处于事务中时
+        使用保存点加入该事务，写入失败时只回滚这一批数据。
+
+        按列名分组，每组只构造一次 INSERT 语句并通过 executemany 批量执行。
+
+        参数:
+            connection (sqlite3.Connection): 用于写入的数据库连接。
+            rows (list): 每个元素是 (列名元组, 值元组)。
+        """
+        rows = sorted(rows, key=itemgetter(0))
+        with self._transaction(connection, "IMMEDIATE"):
+            for column_names, group in groupby(rows, key=itemgetter(0)):
+                query = self._get_insert_query(column_names)
+                connection.executemany(query, map(itemgetter(1), group))
+
+    def _start_writer(self) -> None:
+        """
+        启动后台写入线程。线程已在运行时直接返回。
+        """
+        if self._writer is not None:
+            return
+        # 先调整 buffer_limit，再按其大小创建队列
+        self._tune_buffer_limit()
+        self._queue = queue.Queue(maxsize=self.buffer_limit * 4)
+        self._writer = threading.Thread(target=self._writer_loop, name=f"SQLiteOperator-{self.table_name}", daemon=True)
+        self._writer.start()
+
+    def _stop_writer(self) -> None:
+        """
+        通知后台写入线程写完剩余数据后退出，并等待其结束。
+
+        异常:
+            sqlite3.Error: 如果后台线程写入数据时出错。
+        """
+        if self._writer is None:
+            return
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._writer = None
+        self._queue = None
+        self._writer_failed = False
+        self._raise_writer_error()
+
+    def _raise_writer_error(self) -> None:
+        """
+        抛出后台写入线程记录的异常（如果有）。
+        """
+        if self._writer_error is not None:
+            error, self._writer_error = self._writer_error, None
+            raise error
+
+    def _writer_loop(self) -> None:
+        """
+        后台写入线程的主循环：每次从队列中取出最多 buffer_limit 行，用线程自己的连接在一个
+        事务中写入。打开连接或写入出错后记录异常，并继续从队列取出、丢弃后续数据直到收到退出通知，
+        使生产者不会阻塞在已满的队列上，并在下一次插入、刷新或关闭时看到该异常。
+        """
+        connection = None
+        try:
+            connection = self._open_connection()
+        except Exception as e:
+            logger.exception("SQLite background writer failed to open a connection")
+            self._writer_error = e
+            self._writer_failed = True
+        try:
+            stopping = False
+            while not stopping:
+                rows = [self._queue.get()]
+                while len(rows) < self.buffer_limit:
+                    try:
+                        rows.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                taken = len(rows)
+                if rows[-1] is _STOP:
+                    stopping = True
+                    rows.pop()
+                try:
+                    if rows and not self._writer_failed:
+                        self._write_rows(connection, rows)
+                except Exception as e:
+                    logger.exception("SQLite background writer failed to insert %d rows", len(rows))
+                    self._writer_error = e
+                    self._writer_failed = True
+                finally:
+                    for _ in range(taken):
+                        self._queue.task_done()
+        finally:
+            if connection is not None:
+                connection.close()
+
+    @contextmanager
+    def bulk_load(self):
+        """
+        批量导入时先删除表上的索引，导入结束后再重建，避免每插入一行都要维护所有索引的 B 树。
+
+        只处理显式创建的索引；主键和 UNIQUE 约束自动生成的索引无法删除，会保留。
+        正常退出时会先写入缓冲区中剩余的数据，再重建索引。
+
+        删除索引、导入数据和重建索引在同一个事务中执行；已在 with SQLiteOperator(...) 中时通过保存点
+        加入该事务，不会提前提交。代码块抛出异常时丢弃缓冲区中未写入的数据，并回滚本次导入，
+        被删除的索引随之恢复。
+
+        启用 background_writer 时，后台线程使用自己的连接写入，索引的删除和重建只能各自提交，
+        已由后台线程写入的数据在异常时也不会回滚。
+
+        用法:
+            with operator.bulk_load():
+                for row in rows:
+                    operator.buffer_insert(column_names, row)
+        """
+        self.connect()
+        self.cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? COLLATE NOCASE AND sql IS NOT NULL",
+            (self.table_name,),
+        )
+        indexes = self.cursor.fetchall()
+        drop_sqls = ['DROP INDEX "' + name.replace('"', '""') + '"' for name, _ in indexes]
+        create_sqls = [sql for _, sql in indexes]
+        if self._background_writer:
+            # 主连接不能在导入期间持有写锁，否则后台线程的 BEGIN IMMEDIATE 会被阻塞
+            with self._transaction(self.connection):
+                for sql in drop_sqls:
+                    self.cursor.execute(sql)
+            try:
+                yield self
+                self.execute_buffered_inserts()
+            finally:
+                with self._transaction(self.connection):
+                    for sql in create_sqls:
+                        self.cursor.execute(sql)
+            return
+        with self._transaction(self.connection, "IMMEDIATE"):
+            for sql in drop_sqls:
+                self.cursor.execute(sql)
+            try:
+                yield self
+                self.execute_buffered_inserts()
+            except BaseException:
+                self.insert_buffer = []
+                raise
+            for sql in create_sqls:
+                self.cursor.execute(sql)
+
+    def insert_many_expanded(self, column_names: tuple, rows) -> None:
+        """
+        将多行数据展开为 INSERT ... VALUES (?,?),(?,?),... 形式批量插入。
+
+        每条语句包含的行数受 SQLITE_MAX_VARIABLES 限制。满块语句只构造一次并重复使用，
+        剩余不足一块的行使用单独构造的语句插入。
+
+        参数:
+            column_names (tuple): 要插入的列名。
+            rows (iterable): 每个元素是与列名对应的值元组。
+        """
+        if not column_names:
+            raise ValueError("在调用 SQLiteOperator.insert_many_expanded() 时，'column_names' 不能为空。")
+        chunk = max(1, SQLITE_MAX_VARIABLES // len(column_names))
+        template = "(" + ",".join("?" * len(column_names)) + ")"
+        prefix = f"INSERT INTO {self._qtable} ({', '.join(column_names)}) VALUES "
+        full_query = prefix + ",".join([template] * chunk)
+        rows = iter(rows)
+        self.connect()
+        with self._transaction(self.connection):
+            while True:
+                block = list(islice(rows, chunk))
+                if not block:
+                    break
+                params = list(chain.from_iterable(block))
+                if len(block) == chunk:
+                    self.cursor.execute(full_query, params)
+                else:
+                    self.cursor.execute(prefix + ",".join([template] * len(block)), params)